@@ -1,8 +1,11 @@
 """Semantic search for memories"""
 
+import json
 import logging
+import os
 import sys
 from pathlib import Path
+from typing import Any
 
 sys.path.append(str(Path(__file__).parent.parent))
 from memory.models import StoredMemory
@@ -40,7 +43,9 @@ class MemorySearcher:
         self.model_name = model_name
         self.model = None
         self.data_dir = data_dir or Path(".data")
-        self.embeddings_file = self.data_dir / "embeddings.json"
+        self.embeddings_file = self.data_dir / "memory_embeddings.npz"
+        self.legacy_embeddings_file = self.data_dir / "embeddings.json"
+        self.embeddings_load_failed = False
         self.embeddings = self._load_embeddings()
 
         if EMBEDDINGS_AVAILABLE:
@@ -81,18 +86,19 @@ class MemorySearcher:
         """Search using semantic similarity"""
         try:
             # Encode query
-            query_embedding = self.model.encode(query, convert_to_numpy=True)  # type: ignore
+            query_embedding = self.model.encode(  # type: ignore
+                query, convert_to_numpy=True, normalize_embeddings=True
+            )
 
             # Encode all memory contents
             memory_texts = [m.content for m in memories]
-            memory_embeddings = self.model.encode(memory_texts, convert_to_numpy=True)  # type: ignore
-
-            # Calculate cosine similarities
-            similarities = np.dot(memory_embeddings, query_embedding) / (  # type: ignore[reportOptionalMemberAccess]
-                np.linalg.norm(memory_embeddings, axis=1)  # type: ignore[reportOptionalMemberAccess]
-                * np.linalg.norm(query_embedding)  # type: ignore[reportOptionalMemberAccess]
+            memory_embeddings = self.model.encode(  # type: ignore
+                memory_texts, convert_to_numpy=True, normalize_embeddings=True
             )
 
+            # Both sides are unit length, so cosine similarity is a dot product
+            similarities = np.dot(memory_embeddings, query_embedding)  # type: ignore[reportOptionalMemberAccess]
+
             # Create results with scores
             results = []
             for memory, score in zip(memories, similarities, strict=False):
@@ -147,7 +153,9 @@ class MemorySearcher:
             return None
 
         try:
-            embedding = self.model.encode(text, convert_to_numpy=True)  # type: ignore
+            embedding = self.model.encode(  # type: ignore
+                text, convert_to_numpy=True, normalize_embeddings=True
+            )
             return embedding.tolist()  # type: ignore
         except Exception as e:
             logger.warning(f"Failed to generate embedding: {e}")
@@ -172,30 +180,65 @@ class MemorySearcher:
         Returns:
             Embedding vector or None if not found
         """
-        return self.embeddings.get(memory_id)
+        embedding = self.embeddings.get(memory_id)
+        if embedding is None:
+            return None
+        return [float(value) for value in embedding]
 
-    def _load_embeddings(self) -> dict[str, list[float]]:
-        """Load embeddings from storage"""
-        if not self.embeddings_file.exists():
-            return {}
+    def _load_embeddings(self) -> dict[str, Any]:
+        """Load embeddings from storage
 
-        try:
-            import json
+        Embeddings are stored in one .npz file holding the memory ids and a
+        float32 matrix with one row per id; the older JSON file is only read
+        when no binary store exists yet. Loaded embeddings are row views
+        into the single matrix, so no per-row arrays or lists are built
+        until one is requested.
 
-            with open(self.embeddings_file) as f:
-                return json.load(f)
+        If an existing store cannot be read, saving is disabled so the next
+        store_embedding does not overwrite it with a near-empty store.
+        """
+        try:
+            if EMBEDDINGS_AVAILABLE and self.embeddings_file.exists():
+                with np.load(self.embeddings_file) as data:  # type: ignore[reportOptionalMemberAccess]
+                    ids = data["ids"].tolist()
+                    matrix = data["embeddings"]
+                return dict(zip(ids, matrix, strict=True))
+
+            if self.legacy_embeddings_file.exists():
+                with open(self.legacy_embeddings_file) as f:
+                    return json.load(f)
         except Exception as e:
-            logger.warning(f"Failed to load embeddings: {e}")
-            return {}
+            logger.error(f"Failed to load embeddings, saving disabled: {e}")
+            self.embeddings_load_failed = True
+
+        return {}
 
     def _save_embeddings(self):
         """Save embeddings to storage"""
-        try:
-            import json
+        if not EMBEDDINGS_AVAILABLE:
+            logger.warning("numpy not available, embeddings not saved")
+            return
+
+        if self.embeddings_load_failed:
+            logger.error(
+                f"Not saving embeddings: {self.embeddings_file} could not be loaded"
+            )
+            return
 
+        try:
             self.data_dir.mkdir(parents=True, exist_ok=True)
-            with open(self.embeddings_file, "w") as f:
-                json.dump(self.embeddings, f)
+
+            ids = list(self.embeddings)
+            matrix = np.asarray(  # type: ignore[reportOptionalMemberAccess]
+                [self.embeddings[memory_id] for memory_id in ids],
+                dtype=np.float32,  # type: ignore[reportOptionalMemberAccess]
+            )
+
+            # Ids and matrix share one file, so a single replace updates both
+            tmp_file = self.embeddings_file.with_suffix(".npz.tmp")
+            with open(tmp_file, "wb") as f:
+                np.savez(f, ids=np.array(ids, dtype=str), embeddings=matrix)  # type: ignore[reportOptionalMemberAccess]
+            os.replace(tmp_file, self.embeddings_file)
         except Exception as e:
             logger.error(f"Failed to save embeddings: {e}")
 
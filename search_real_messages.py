@@ -5,13 +5,50 @@ Search REAL conversation messages using semantic similarity
 Uses actual messages stored from real sessions
 """
 
+import heapq
 import json
+import os
+import pickle
+import re
 import sys
+from collections import Counter, defaultdict
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Any, List, Dict, Optional, Tuple
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+# orjson parses memory.json several times faster; stdlib json is the fallback
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# SimSIMD provides SIMD kernels for similarity; NumPy is the fallback
+try:
+    import simsimd
+
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    simsimd = None  # type: ignore
+    SIMSIMD_AVAILABLE = False
+
+# Faiss HNSW index gives sub-linear top-k; linear scan is the fallback
+try:
+    import faiss
+
+    FAISS_AVAILABLE = True
+except ImportError:
+    faiss = None  # type: ignore
+    FAISS_AVAILABLE = False
+
+# Part of the query cache key, so swapping models invalidates cached vectors
+BUILTIN_MODEL_VERSION = "all-MiniLM-L6-v2"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
 
 def load_messages(data_dir: Path) -> List[Dict]:
     """Load real messages from storage"""
@@ -21,8 +58,7 @@ def load_messages(data_dir: Path) -> List[Dict]:
         print("❌ No memory file found. Run store_real_messages.py first")
         return []
 
-    with open(memory_file) as f:
-        data = json.load(f)
+    data = json_loads(memory_file.read_bytes())
 
     messages = data.get("messages", [])
     metadata = data.get("metadata", {})
@@ -35,70 +71,322 @@ def load_messages(data_dir: Path) -> List[Dict]:
     return messages
 
 
-def load_embeddings(data_dir: Path) -> Dict:
-    """Load embeddings index"""
-    embeddings_file = data_dir / "embeddings.json"
+def load_embeddings(
+    data_dir: Path, messages_by_id: Dict[str, Dict]
+) -> Tuple[List[str], Optional[Any], Optional[float]]:
+    """Load embeddings matrix, its row-aligned ids and quantization scale
+
+    The int8 matrix (with its scale) is used only with SimSIMD, else float32
+    (scale None). Rows whose message is gone are dropped.
+    """
+    embeddings_file = data_dir / "embeddings.npy"
+    quantized_file = data_dir / "embeddings_i8.npy"
+    quantization_file = data_dir / "quantization.json"
+    ids_file = data_dir / "ids.json"
+
+    if not ids_file.exists():
+        return [], None, None
+
+    try:
+        import numpy as np
+    except ImportError:
+        return [], None, None
+
+    with open(ids_file) as f:
+        ids = json.load(f)
+
+    # A matrix whose row count differs from ids.json (e.g. an interrupted
+    # store) would map rows to the wrong messages, so it is ignored
+    embeddings = None
+    scale = None
+    if SIMSIMD_AVAILABLE and quantized_file.exists() and quantization_file.exists():
+        quantized = np.load(quantized_file, mmap_mode="r")
+        if quantized.shape[0] == len(ids):
+            with open(quantization_file) as f:
+                scale = json.load(f)["scale"]
+            embeddings = quantized
+        else:
+            print("⚠️  embeddings_i8.npy does not match ids.json, ignoring it")
+
+    if embeddings is None and embeddings_file.exists():
+        matrix = np.load(embeddings_file, mmap_mode="r")
+        if matrix.shape[0] == len(ids):
+            embeddings = matrix
+        else:
+            print("⚠️  embeddings.npy does not match ids.json, ignoring it")
+
+    if embeddings is None:
+        return [], None, None
+
+    rows = [i for i, msg_id in enumerate(ids) if msg_id in messages_by_id]
+    if len(rows) == len(ids):
+        return ids, embeddings, scale
+
+    return [ids[i] for i in rows], np.ascontiguousarray(embeddings[rows]), scale
+
+
+def load_faiss_index(data_dir: Path) -> Tuple[List[str], Optional[Any]]:
+    """Load the HNSW index and the ids of its rows, if available"""
+    index_file = data_dir / "faiss.idx"
+    ids_file = data_dir / "ids.json"
+
+    if not FAISS_AVAILABLE or not index_file.exists() or not ids_file.exists():
+        return [], None
+
+    with open(ids_file) as f:
+        ids = json.load(f)
+
+    try:
+        index = faiss.read_index(str(index_file))  # type: ignore[union-attr]
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable faiss.idx: {e}")
+        return [], None
+
+    if index.ntotal != len(ids):
+        print("⚠️  faiss.idx does not match ids.json, ignoring it")
+        return [], None
+
+    return ids, index
+
+
+def cosine_similarities(
+    embeddings: Any, query_embedding: Any, scale: Optional[float] = None
+) -> Any:
+    """Cosine similarity of a normalized query against every embedding row
+
+    With a scale, embeddings are int8 rows quantized by that factor (only
+    loaded when SimSIMD is available); the query is quantized the same way
+    and the integer dot products are rescaled back to cosine similarity.
+    """
+    import numpy as np
+
+    # SimSIMD rejects empty collections, e.g. when every stored row is stale
+    if embeddings.shape[0] == 0:
+        return np.empty(0, dtype=np.float32)
+
+    if scale is not None:
+        max_abs = float(np.abs(query_embedding).max())
+        query_scale = 127.0 / max_abs if max_abs > 0 else 1.0
+        query_i8 = np.round(query_embedding * query_scale).astype(np.int8)
+
+        dots = np.asarray(
+            simsimd.cdist(query_i8[None, :], embeddings, metric="dot")  # type: ignore[union-attr]
+        )[0]
+        return dots / (query_scale * scale)
+
+    # Stored rows and the query are L2-normalized, so their dot product
+    # is the cosine similarity against every message
+    if SIMSIMD_AVAILABLE:
+        return np.asarray(
+            simsimd.cdist(query_embedding[None, :], embeddings, metric="dot")  # type: ignore[union-attr]
+        )[0]
+
+    return embeddings @ query_embedding
+
+
+def top_k(scores: Any, limit: int) -> Any:
+    """Indices of the highest scores, best first, without a full sort"""
+    import numpy as np
+
+    k = min(limit, scores.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
 
-    if not embeddings_file.exists():
+
+def load_query_cache(cache_file: Path) -> Dict[Tuple[str, str], Any]:
+    """Load cached query embeddings, keyed by (model, normalized text)"""
+    if not cache_file.exists():
         return {}
 
-    with open(embeddings_file) as f:
-        return json.load(f)
+    try:
+        with open(cache_file, "rb") as f:
+            cache = pickle.load(f)
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable query cache: {e}")
+        return {}
 
+    if not isinstance(cache, dict):
+        print("⚠️  Ignoring query cache with unexpected contents")
+        return {}
 
-def search_semantic(
-    query: str, messages: List[Dict], embeddings: Dict, limit: int = 5
-) -> List[Tuple[Dict, float]]:
-    """Search using semantic similarity"""
+    return cache
+
+
+def save_query_cache(cache: Dict[Tuple[str, str], Any], cache_file: Path):
+    """Atomically rewrite the query embedding cache"""
+    tmp_file = cache_file.with_suffix(".pkl.tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+
+def encode_queries(queries: List[str], data_dir: Path) -> Optional[Any]:
+    """Encode all queries, reusing cached vectors from earlier runs
+
+    Only queries missing from the cache are encoded, in one batch with a
+    single model load. Returns a (len(queries), 384) float32 matrix of
+    normalized vectors, or None when the libraries are not installed.
+    """
     try:
-        from sentence_transformers import SentenceTransformer
         import numpy as np
+    except ImportError:
+        print("⚠️  numpy not installed for semantic search")
+        return None
 
-        model = SentenceTransformer("all-MiniLM-L6-v2")
+    cache_file = data_dir / "embedding_cache.pkl"
+    cache = load_query_cache(cache_file)
 
-        # Encode query
-        query_embedding = model.encode(query)
+    # The model is uncased, so lowercasing does not change the embedding;
+    # the model name in the key invalidates entries when the model changes
+    keys = [(BUILTIN_MODEL_VERSION, query.strip().lower()) for query in queries]
+    missing = list(dict.fromkeys(key for key in keys if key not in cache))
 
-        # Calculate similarities
-        results = []
-        for msg in messages:
-            msg_id = msg["id"]
-            if msg_id in embeddings:
-                msg_embedding = np.array(embeddings[msg_id])
+    if missing:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            print("⚠️  sentence-transformers not installed for semantic search")
+            return None
 
-                # Cosine similarity
-                similarity = np.dot(query_embedding, msg_embedding) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(msg_embedding)
-                )
+        model = SentenceTransformer(BUILTIN_MODEL_VERSION)
 
-                results.append((msg, float(similarity)))
+        vectors = model.encode(
+            [text for _, text in missing],
+            batch_size=len(missing),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        for key, vector in zip(missing, vectors):
+            cache[key] = vector.astype(np.float32)
 
-        # Sort by similarity
-        results.sort(key=lambda x: x[1], reverse=True)
+        save_query_cache(cache, cache_file)
 
-        return results[:limit]
+    return np.stack([cache[key] for key in keys])
 
-    except ImportError:
-        print("⚠️  sentence-transformers not installed for semantic search")
+
+def search_semantic(
+    query_embedding: Any,
+    messages_by_id: Dict[str, Dict],
+    ids: List[str],
+    embeddings: Any,
+    scale: Optional[float] = None,
+    limit: int = 5,
+) -> List[Tuple[Dict, float]]:
+    """Search using semantic similarity to a precomputed query vector"""
+    sims = cosine_similarities(embeddings, query_embedding, scale)
+
+    return [(messages_by_id[ids[i]], float(sims[i])) for i in top_k(sims, limit)]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def build_keyword_index(messages: List[Dict]) -> Dict[str, Any]:
+    """Build an inverted index: token -> {message row: term frequency}"""
+    postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+    lengths = []
+
+    for row, msg in enumerate(messages):
+        tokens = tokenize(msg["content"])
+        lengths.append(max(1, len(tokens)))
+        for token, tf in Counter(tokens).items():
+            postings[token][row] = tf
+
+    return {"postings": dict(postings), "lengths": lengths}
+
+
+def load_keyword_index(data_dir: Path, messages: List[Dict]) -> Dict[str, Any]:
+    """Load the keyword index sidecar, rebuilding it when memory.json changed"""
+    memory_stat = (data_dir / "memory.json").stat()
+    source = (memory_stat.st_mtime_ns, memory_stat.st_size)
+    index_file = data_dir / "keyword_index.pkl"
+
+    if index_file.exists():
+        try:
+            with open(index_file, "rb") as f:
+                index = pickle.load(f)
+            if isinstance(index, dict) and index.get("source") == source:
+                return index
+        except Exception as e:
+            print(f"⚠️  Rebuilding unreadable keyword index: {e}")
+
+    index = build_keyword_index(messages)
+    index["source"] = source
+
+    tmp_file = index_file.with_suffix(".pkl.tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, index_file)
+
+    return index
+
+
+def search_faiss(
+    query_embedding: Any,
+    messages_by_id: Dict[str, Dict],
+    ids: List[str],
+    index: Any,
+    limit: int = 5,
+) -> List[Tuple[Dict, float]]:
+    """Search the HNSW index with a precomputed query vector
+
+    Rows whose message is no longer stored are skipped; the search widens
+    until limit results are found or the whole index has been returned.
+    """
+    query = query_embedding.reshape(1, -1)
+    k = min(limit, index.ntotal)
+    if k <= 0:
         return []
 
+    while True:
+        index.hnsw.efSearch = max(64, k)
+        scores, rows = index.search(query, k)
+
+        results = [
+            (messages_by_id[ids[row]], float(score))
+            for score, row in zip(scores[0], rows[0])
+            if row >= 0 and ids[row] in messages_by_id
+        ]
+        if len(results) >= limit or k >= index.ntotal:
+            return results[:limit]
+        k = min(k * 2, index.ntotal)
+
 
 def search_keyword(
-    query: str, messages: List[Dict], limit: int = 5
+    query: str, messages: List[Dict], keyword_index: Dict[str, Any], limit: int = 5
 ) -> List[Tuple[Dict, float]]:
-    """Simple keyword search fallback"""
-    query_lower = query.lower()
-    results = []
+    """Keyword search fallback over the inverted index
+
+    Matches messages containing every query token and scores them by the
+    summed term frequency of those tokens, normalized by message length.
+    """
+    tokens = set(tokenize(query))
+    postings = keyword_index["postings"]
+    lengths = keyword_index["lengths"]
 
-    for msg in messages:
-        content_lower = msg["content"].lower()
-        if query_lower in content_lower:
-            # Simple relevance score based on match count
-            score = content_lower.count(query_lower) / len(content_lower.split())
-            results.append((msg, score))
+    if not tokens or any(token not in postings for token in tokens):
+        return []
+
+    # Intersect posting lists starting from the rarest token
+    token_postings = sorted((postings[token] for token in tokens), key=len)
+    rows = set(token_postings[0])
+    for posting in token_postings[1:]:
+        rows.intersection_update(posting)
+        if not rows:
+            return []
+
+    results = [
+        (messages[row], sum(posting[row] for posting in token_postings) / lengths[row])
+        for row in sorted(rows)
+    ]
 
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results[:limit]
+    # Keyword search must work without NumPy, so use a bounded heap for top-k
+    return heapq.nlargest(limit, results, key=itemgetter(1))
 
 
 def main():
@@ -114,7 +402,9 @@ def main():
     if not messages:
         return
 
-    embeddings = load_embeddings(data_dir)
+    messages_by_id = {msg["id"]: msg for msg in messages}
+    ids, embeddings, scale = load_embeddings(data_dir, messages_by_id)
+    faiss_ids, faiss_index = load_faiss_index(data_dir)
 
     # Test queries
     queries = [
@@ -123,17 +413,42 @@ def main():
         "memory extraction",
     ]
 
-    for query in queries:
+    # Built on first use, only needed when falling back to keyword search
+    keyword_index = None
+
+    # Try semantic search first, encoding every query in one pass
+    query_embeddings = (
+        encode_queries(queries, data_dir) if embeddings is not None else None
+    )
+
+    for q_index, query in enumerate(queries):
         print(f"\n{'=' * 70}")
         print(f"🔍 Query: '{query}'")
         print("=" * 70)
 
-        # Try semantic search first
-        if embeddings:
-            results = search_semantic(query, messages, embeddings, limit=3)
+        if query_embeddings is not None and faiss_index is not None:
+            results = search_faiss(
+                query_embeddings[q_index],
+                messages_by_id,
+                faiss_ids,
+                faiss_index,
+                limit=3,
+            )
+            search_type = "Semantic (HNSW)"
+        elif query_embeddings is not None:
+            results = search_semantic(
+                query_embeddings[q_index],
+                messages_by_id,
+                ids,
+                embeddings,
+                scale,
+                limit=3,
+            )
             search_type = "Semantic"
         else:
-            results = search_keyword(query, messages, limit=3)
+            if keyword_index is None:
+                keyword_index = load_keyword_index(data_dir, messages)
+            results = search_keyword(query, messages, keyword_index, limit=3)
             search_type = "Keyword"
 
         if not results:
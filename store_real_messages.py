@@ -5,14 +5,36 @@ Store REAL conversation messages from Claude Code sessions
 NO AI EXTRACTION - stores actual messages as-is
 """
 
+import heapq
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from datetime import datetime
-from typing import List, Dict
+from datetime import datetime, timezone
+from typing import List, Dict, Tuple
 import sys
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+# orjson parses and serializes several times faster; stdlib json is the fallback
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None  # type: ignore
+    json_loads = json.loads
+
+
+def dump_json_bytes(data, pretty: bool = False) -> bytes:
+    """Serialize data to JSON bytes, compact unless pretty is set"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
 
 def find_session_directory() -> Path:
     """Find the Claude Code session directory"""
@@ -26,50 +48,99 @@ def find_session_directory() -> Path:
     raise FileNotFoundError("Session directory not found")
 
 
-def load_real_messages(session_dir: Path, limit: int = 100) -> List[Dict]:
-    """Load ACTUAL messages from session files - no AI processing"""
-    print(f"\n📁 Reading from: {session_dir}")
+MIN_TIMESTAMP = datetime.min.replace(tzinfo=timezone.utc)
 
-    jsonl_files = list(session_dir.glob("*.jsonl"))
-    print(f"📊 Found {len(jsonl_files)} message files")
 
-    messages = []
-    for jsonl_file in jsonl_files:
-        try:
-            with open(jsonl_file) as f:
-                for line in f:
-                    if line.strip():
-                        data = json.loads(line)
-                        if "message" in data:
-                            msg = data["message"]
-                            msg["timestamp"] = data.get("timestamp")
-                            msg["session_id"] = data.get("sessionId")
-                            messages.append(msg)
-        except Exception as e:
-            print(f"⚠️  Error reading {jsonl_file.name}: {e}")
-            continue
+def parse_timestamp(ts) -> datetime:
+    """Parse a message timestamp into an aware datetime
+
+    Missing timestamps sort as 2000-01-01; non-string values sort first.
+    """
+    ts = ts or "2000-01-01T00:00:00+00:00"
+    if not isinstance(ts, str):
+        return MIN_TIMESTAMP
+    return parse_iso_timestamp(ts)
 
-    # Sort by timestamp
-    def get_timestamp(msg):
-        ts = msg.get("timestamp") or "2000-01-01T00:00:00+00:00"
-        try:
-            dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-            if dt.tzinfo is None:
-                from datetime import timezone
 
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt
-        except (ValueError, AttributeError):
-            from datetime import timezone
+@lru_cache(maxsize=4096)
+def parse_iso_timestamp(ts: str) -> datetime:
+    """Parse an ISO timestamp string, memoized per raw string"""
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return MIN_TIMESTAMP
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def parse_jsonl_file(jsonl_file: Path, limit: int) -> Tuple[int, List[Tuple]]:
+    """Parse one session file, keeping its newest `limit` messages
+
+    Runs in a worker process. Returns the number of messages seen and
+    heap entries of (timestamp, line sequence, message).
+    """
+    # Min-heap keyed by timestamp; the sequence number breaks ties in file
+    # order and avoids comparing dicts
+    heap = []
+    total = 0
+    try:
+        with open(jsonl_file, "rb", buffering=1 << 20) as f:
+            for line in f:
+                if line.strip():
+                    data = json_loads(line)
+                    if "message" in data:
+                        msg = data["message"]
+                        msg["timestamp"] = data.get("timestamp")
+                        msg["session_id"] = data.get("sessionId")
+                        entry = (parse_timestamp(msg["timestamp"]), total, msg)
+                        total += 1
+                        if len(heap) < limit:
+                            heapq.heappush(heap, entry)
+                        else:
+                            heapq.heappushpop(heap, entry)
+    except Exception as e:
+        print(f"⚠️  Error reading {jsonl_file.name}: {e}")
+
+    return total, heap
 
-            return datetime.min.replace(tzinfo=timezone.utc)
 
-    messages.sort(key=get_timestamp)
+def load_real_messages(session_dir: Path, limit: int = 100) -> List[Dict]:
+    """Load ACTUAL messages from session files - no AI processing"""
+    print(f"\n📁 Reading from: {session_dir}")
 
-    print(f"✅ Loaded {len(messages)} messages total")
+    # Empty files hold no messages, so skip them without opening
+    with os.scandir(session_dir) as entries:
+        jsonl_files = [
+            Path(entry.path)
+            for entry in entries
+            if entry.name.endswith(".jsonl")
+            and entry.is_file()
+            and entry.stat().st_size > 0
+        ]
+    print(f"📊 Found {len(jsonl_files)} message files")
+
+    # Parse files in parallel; each worker returns only its newest messages,
+    # which are merged here keyed by (timestamp, file index, line sequence)
+    heap = []
+    total = 0
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(
+            partial(parse_jsonl_file, limit=limit), jsonl_files, chunksize=4
+        )
+        for file_index, (count, entries) in enumerate(results):
+            total += count
+            for ts, seq, msg in entries:
+                entry = (ts, file_index, seq, msg)
+                if len(heap) < limit:
+                    heapq.heappush(heap, entry)
+                else:
+                    heapq.heappushpop(heap, entry)
+
+    print(f"✅ Loaded {total} messages total")
     print(f"📅 Using last {limit} messages")
 
-    return messages[-limit:]
+    return [msg for _, _, _, msg in sorted(heap)]
 
 
 def extract_text_from_content(content) -> str:
@@ -77,16 +148,19 @@ def extract_text_from_content(content) -> str:
     if isinstance(content, str):
         return content
     elif isinstance(content, list):
-        text_parts = []
-        for item in content:
-            if isinstance(item, dict) and item.get("type") == "text":
-                text_parts.append(item.get("text", ""))
-        return " ".join(text_parts)
+        return " ".join(
+            item["text"]
+            for item in content
+            if isinstance(item, dict) and item.get("type") == "text" and "text" in item
+        )
     return ""
 
 
-def store_messages(messages: List[Dict], data_dir: Path):
-    """Store actual messages in memory.json - NO AI PROCESSING"""
+def store_messages(messages: List[Dict], data_dir: Path, pretty: bool = False):
+    """Store actual messages in memory.json - NO AI PROCESSING
+
+    The file is written compact; pass pretty=True for indented output.
+    """
     data_dir.mkdir(parents=True, exist_ok=True)
     memory_file = data_dir / "memory.json"
 
@@ -100,7 +174,7 @@ def store_messages(messages: List[Dict], data_dir: Path):
         timestamp = msg.get("timestamp")
 
         # Skip system messages
-        if role not in ["user", "assistant"]:
+        if role not in ("user", "assistant"):
             continue
 
         # Extract text
@@ -133,8 +207,10 @@ def store_messages(messages: List[Dict], data_dir: Path):
         },
     }
 
-    with open(memory_file, "w") as f:
-        json.dump(data, f, indent=2)
+    # Write to a temp file and swap it in so readers never see a partial file
+    tmp_file = memory_file.with_suffix(".json.tmp")
+    tmp_file.write_bytes(dump_json_bytes(data, pretty=pretty))
+    os.replace(tmp_file, memory_file)
 
     print(f"✅ Stored {len(memories)} real messages")
     print(f"📝 File: {memory_file}")
@@ -147,32 +223,85 @@ def create_embeddings_index(messages: List[Dict], data_dir: Path):
     print("\n🧠 Creating embeddings from real messages...")
 
     try:
+        import numpy as np
         from sentence_transformers import SentenceTransformer
 
         model = SentenceTransformer("all-MiniLM-L6-v2")
 
-        # Create embeddings for actual message content
-        texts = [msg["content"] for msg in messages]
-        embeddings = model.encode(texts)
-
-        # Store embeddings
-        embeddings_file = data_dir / "embeddings.json"
-        embeddings_data = {
-            msg["id"]: embedding.tolist()
-            for msg, embedding in zip(messages, embeddings)
-        }
-
-        with open(embeddings_file, "w") as f:
-            json.dump(embeddings_data, f)
-
-        print(f"✅ Created {len(embeddings_data)} embeddings")
-        print(f"📝 File: {embeddings_file}")
+        # Encode each distinct message text once, then expand back to one
+        # row per message (chat logs repeat prompts like "continue")
+        unique_rows: Dict[str, int] = {}
+        rows = [
+            unique_rows.setdefault(msg["content"], len(unique_rows)) for msg in messages
+        ]
+        unique_embeddings = model.encode(
+            list(unique_rows),
+            batch_size=64,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        # Empty input encodes to a 1-D array; keep the (N, dim) matrix shape
+        # so an empty store still writes consistent, empty index files
+        dim = model.get_sentence_embedding_dimension()
+        embeddings = unique_embeddings.reshape(-1, dim)[rows]
+
+        # Any existing HNSW index maps rows to the old ids; remove it before
+        # touching the other files so it can never be paired with new ids
+        (data_dir / "faiss.idx").unlink(missing_ok=True)
+
+        # Store embeddings as one float32 matrix, rows aligned with ids.json
+        embeddings_file = data_dir / "embeddings.npy"
+        ids_file = data_dir / "ids.json"
+        embeddings = embeddings.astype(np.float32)
+        np.save(embeddings_file, embeddings)
+
+        # Also store an int8 copy for search: 4x smaller to scan
+        quantized_file = data_dir / "embeddings_i8.npy"
+        quantization_file = data_dir / "quantization.json"
+        max_abs = float(np.abs(embeddings).max()) if embeddings.size else 0.0
+        scale = 127.0 / max_abs if max_abs > 0 else 1.0
+        np.save(quantized_file, np.round(embeddings * scale).astype(np.int8))
+
+        with open(quantization_file, "w") as f:
+            json.dump({"dtype": "int8", "scale": scale}, f)
+
+        # Ids go last: search ignores matrices whose row count differs, so an
+        # interrupted run is detected rather than mapping rows to wrong ids
+        with open(ids_file, "w") as f:
+            json.dump([msg["id"] for msg in messages], f)
+
+        print(f"✅ Created {len(embeddings)} embeddings")
+        print(f"📝 Files: {embeddings_file}, {quantized_file}, {ids_file}")
+
+        create_faiss_index(embeddings, data_dir)
 
     except ImportError:
         print("⚠️  sentence-transformers not installed")
         print("   Run: uv add sentence-transformers")
 
 
+def create_faiss_index(embeddings, data_dir: Path):
+    """Build an HNSW index over normalized embeddings for sub-linear search"""
+    try:
+        import faiss
+    except ImportError:
+        print("⚠️  faiss not installed, search will scan all embeddings")
+        print("   Run: uv add faiss-cpu")
+        return
+
+    # Rows are L2-normalized, so inner product ranks by cosine similarity;
+    # index rows follow the same order as ids.json
+    index = faiss.IndexHNSWFlat(embeddings.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    index.add(embeddings)
+
+    index_file = data_dir / "faiss.idx"
+    faiss.write_index(index, str(index_file))
+
+    print(f"✅ Created HNSW index with {index.ntotal} vectors")
+    print(f"📝 File: {index_file}")
+
+
 def main():
     """Store real messages and create index"""
     print("\n" + "=" * 70)
@@ -186,7 +315,7 @@ def main():
 
     # Store actual messages
     data_dir = Path(".data")
-    stored_messages = store_messages(messages, data_dir)
+    stored_messages = store_messages(messages, data_dir, pretty="--pretty" in sys.argv)
 
     # Create embeddings index
     create_embeddings_index(stored_messages, data_dir)